@@ -7,10 +7,14 @@ A multi-threaded chat interface with persistent conversation history.
 import streamlit as st
 from backend import chatbot, retrieve_all_threads, get_conversation_history
 from langchain_core.messages import HumanMessage
+import secrets
 import uuid
 from typing import List, Dict, Any
 import time
 
+# st.fragment graduated from experimental in Streamlit 1.37
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
 # Page configuration
 st.set_page_config(
     page_title="LangGraph Chatbot",
@@ -20,7 +24,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better UI
-st.markdown("""
+CUSTOM_CSS = """
     <style>
     .stApp {
         max-width: 1200px;
@@ -48,49 +52,93 @@ st.markdown("""
         margin-right: 20%;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
 
 def generate_thread_id() -> str:
-    """Generate a new unique thread ID."""
-    return str(uuid.uuid4())
+    """Generate a new unique, time-ordered thread ID (UUIDv7).
+    
+    The 48-bit millisecond timestamp prefix makes IDs sort by creation time.
+    """
+    timestamp_ms = int(time.time() * 1000) & ((1 << 48) - 1)
+    rand_a = secrets.randbits(12)
+    rand_b = secrets.randbits(62)
+    value = (timestamp_ms << 80) | (0x7 << 76) | (rand_a << 64) | (0b10 << 62) | rand_b
+    return str(uuid.UUID(int=value))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_thread_ids() -> List[str]:
+    """Return the most recent thread IDs, cached across reruns and sessions.
+
+    Cleared whenever a new thread is first written to the database.
+    """
+    return retrieve_all_threads()
 
 def initialize_session_state():
     """Initialize session state variables."""
     if 'message_history' not in st.session_state:
         st.session_state.message_history = []
     
+    if 'has_earlier_messages' not in st.session_state:
+        st.session_state.has_earlier_messages = False
+    
     if 'thread_id' not in st.session_state:
         st.session_state.thread_id = generate_thread_id()
     
     if 'chat_threads' not in st.session_state:
-        st.session_state.chat_threads = retrieve_all_threads()
-        if st.session_state.thread_id not in st.session_state.chat_threads:
-            st.session_state.chat_threads.append(st.session_state.thread_id)
+        # Ordered oldest to newest so new threads are O(1) appends; the dict
+        # gives O(1) membership checks and keeps insertion order
+        st.session_state.chat_threads = dict.fromkeys(
+            reversed(load_thread_ids())
+        )
+        st.session_state.chat_threads.setdefault(st.session_state.thread_id, None)
 
 def reset_chat():
     """Reset the current chat and create a new thread."""
     thread_id = generate_thread_id()
     st.session_state.thread_id = thread_id
-    if thread_id not in st.session_state.chat_threads:
-        st.session_state.chat_threads.append(thread_id)
+    st.session_state.chat_threads.setdefault(thread_id, None)
     st.session_state.message_history = []
+    st.session_state.has_earlier_messages = False
     st.rerun()
 
+# Number of messages loaded per page when opening a conversation
+HISTORY_PAGE_SIZE = 50
+
+def to_history_entries(messages: List[Any]) -> List[Dict[str, str]]:
+    """Convert LangChain messages into message_history entries."""
+    return [
+        {"role": "user" if isinstance(msg, HumanMessage) else "assistant", "content": msg.content}
+        for msg in messages
+    ]
+
+def fetch_history_page(thread_id: str, before: int = 0) -> List[Dict[str, str]]:
+    """Fetch one page of history and record whether older messages remain."""
+    # Request one extra message to learn whether an earlier page exists
+    messages = get_conversation_history(thread_id, limit=HISTORY_PAGE_SIZE + 1, before=before)
+    st.session_state.has_earlier_messages = len(messages) > HISTORY_PAGE_SIZE
+    return to_history_entries(messages[-HISTORY_PAGE_SIZE:])
+
 def load_conversation(thread_id: str):
-    """Load conversation history for a specific thread."""
+    """Load the most recent page of history for a specific thread."""
     st.session_state.thread_id = thread_id
-    messages = get_conversation_history(thread_id)
-    
-    st.session_state.message_history = []
-    for msg in messages:
-        role = "user" if isinstance(msg, HumanMessage) else "assistant"
-        st.session_state.message_history.append({"role": role, "content": msg.content})
+    st.session_state.message_history = fetch_history_page(thread_id)
     
     # Rerun to update the UI
     st.rerun()
 
+def load_earlier_messages():
+    """Prepend the previous page of history for the current thread."""
+    st.session_state.message_history[:0] = fetch_history_page(
+        st.session_state.thread_id,
+        before=len(st.session_state.message_history)
+    )
+
 def render_sidebar():
-    """Render the sidebar with thread management."""
+    """Render the sidebar with thread management.
+    
+    Not a fragment: New Chat and thread clicks both change the active
+    conversation, which needs an app-wide rerun to refresh the chat area.
+    """
     with st.sidebar:
         st.title("💬 Chat Threads")
         
@@ -100,25 +148,61 @@ def render_sidebar():
         st.markdown("---")
         st.subheader("Your Conversations")
         
-        # Display conversation threads with timestamps if available
+        # Display conversation threads, newest first
         for thread_id in reversed(st.session_state.chat_threads):
-            # Truncate the thread ID for display
-            display_id = f"{thread_id[:8]}..."
+            # Show the random tail; the leading timestamp is shared by nearby threads
+            display_id = f"...{thread_id[-8:]}"
             if st.button(
                 f"💬 {display_id}",
                 key=f"thread_{thread_id}",
-                on_click=load_conversation,
-                args=(thread_id,),
                 use_container_width=True
             ):
-                pass
+                load_conversation(thread_id)
 
 def render_chat_messages():
-    """Render the chat message history."""
+    """Render the chat message history.
+    
+    st.markdown only ships the raw string; Markdown is parsed in the browser,
+    so there is no server-side rendering to cache between reruns.
+    """
+    if st.session_state.has_earlier_messages:
+        if st.button("Load earlier messages"):
+            load_earlier_messages()
+    
     for message in st.session_state.message_history:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+# Streamed tokens are forwarded to the UI in batches of this many chunks or
+# after this many seconds, whichever comes first
+STREAM_FLUSH_CHUNKS = 4
+STREAM_FLUSH_INTERVAL = 0.05
+
+def stream_response(user_input: str, config: Dict[str, Any]):
+    """Yield the assistant's reply in small batches for st.write_stream.
+    
+    write_stream redraws its markdown element with the full text so far on
+    every yield, so batching is what bounds the number of redraws.
+    """
+    parts = []
+    last_flush = time.monotonic()
+    for chunk in chatbot.stream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config=config,
+        stream_mode="messages"
+    ):
+        content = getattr(chunk[0], 'content', None)
+        if not content:
+            continue
+        parts.append(content)
+        now = time.monotonic()
+        if len(parts) >= STREAM_FLUSH_CHUNKS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+            yield "".join(parts)
+            parts.clear()
+            last_flush = now
+    if parts:
+        yield "".join(parts)
+
 def handle_user_input():
     """Handle user input and generate responses."""
     if user_input := st.chat_input("Type your message..."):
@@ -127,40 +211,45 @@ def handle_user_input():
             st.markdown(user_input)
         
         # Add to message history
+        is_new_thread = not st.session_state.message_history
         st.session_state.message_history.append({"role": "user", "content": user_input})
         
         # Prepare the configuration for the chatbot
         config = {
             "configurable": {"thread_id": st.session_state.thread_id},
             "metadata": {"thread_id": st.session_state.thread_id},
-            "run_name": "chat_turn",
         }
         
         # Display assistant response
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
-            
-            # Stream the response
-            for chunk in chatbot.stream(
-                {"messages": [HumanMessage(content=user_input)]},
-                config=config,
-                stream_mode="messages"
-            ):
-                if hasattr(chunk[0], 'content'):
-                    full_response += chunk[0].content
-                    message_placeholder.markdown(full_response + "▌")
-            
-            message_placeholder.markdown(full_response)
+            # Stream the response; write_stream re-sends the accumulated reply
+            # on each yielded chunk, so stream_response batches tokens to keep
+            # those updates infrequent
+            full_response = st.write_stream(
+                stream_response(user_input, config)
+            )
             
             # Update message history
             st.session_state.message_history.append({
                 "role": "assistant",
                 "content": full_response
             })
+        
+        # The first turn persists the thread, so other sessions must re-query
+        if is_new_thread:
+            load_thread_ids.clear()
+
+@fragment
+def render_chat_area():
+    """Render the message history and input; a chat turn only reruns this
+    fragment instead of the whole app."""
+    render_chat_messages()
+    handle_user_input()
 
 def main():
     """Main application function."""
+    # Emitted on full reruns only; chat turns rerun just the chat fragment below
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
     st.title("🤖 LangGraph Chatbot")
     
     # Initialize session state
@@ -169,11 +258,8 @@ def main():
     # Render the UI
     render_sidebar()
     
-    # Display chat messages
-    render_chat_messages()
-    
-    # Handle user input
-    handle_user_input()
+    # Display chat messages and handle user input
+    render_chat_area()
 
 if __name__ == "__main__":
     main()
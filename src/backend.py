@@ -5,93 +5,298 @@ This module implements a persistent, thread-aware chatbot using LangGraph and SQ
 It supports multi-threaded conversations with persistent storage.
 """
 
-from typing import TypedDict, Annotated, List
+from typing import TypedDict, Annotated, Iterator, List, Optional
+from contextlib import contextmanager
 from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph.message import add_messages
 from dotenv import load_dotenv
+from pathlib import Path
+import httpx
+import logging
+import queue
 import sqlite3
+import threading
 import os
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the language model
+# Configure logging
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING'))
+log = logging.getLogger(__name__)
+
+# Shared HTTP client for OpenAI requests. httpx drops idle connections after
+# 5 seconds by default, shorter than the pause between chat turns, so keep them
+# alive longer to avoid a fresh TCP/TLS handshake on every turn.
+http_client = httpx.Client(
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=120.0)
+)
+
+# Initialize the language model. streaming=True makes invoke() consume the
+# response as a token stream, so chatbot.stream(stream_mode="messages") can
+# forward each token as it arrives instead of waiting for the full reply.
 llm = ChatOpenAI(
     model="gpt-3.5-turbo",
     temperature=0.7,
-    max_tokens=500
+    max_tokens=500,
+    streaming=True,
+    http_client=http_client
 )
 
+# Summarizer for older turns; the "nostream" tag keeps its tokens out of
+# chatbot.stream(stream_mode="messages") so only the reply reaches the UI
+summarizer = llm.with_config(tags=["nostream"])
+
+# Number of most recent messages always sent to the model verbatim
+CONTEXT_WINDOW = 12
+# Maximum transcript length passed to one summarizer call; only reached when
+# many windows are folded at once, e.g. threads created before summaries existed
+SUMMARY_MAX_INPUT_CHARS = 24000
+
 class ChatState(TypedDict):
-    """State definition for the chat application."""
+    """State definition for the chat application.
+    
+    `summary` covers the first `summarized_upto` non-system messages and is
+    persisted by the checkpointer along with the messages themselves.
+    """
     messages: Annotated[List[BaseMessage], add_messages]
+    summary: str
+    summarized_upto: int
+
+def extend_summary(previous: str, messages: List[BaseMessage]) -> str:
+    """Fold messages into an existing summary with one summarizer call.
+    
+    Args:
+        previous: Summary of the conversation so far, or "" if none
+        messages: Messages following those covered by `previous`
+        
+    Returns:
+        str: Summary covering both
+    """
+    transcript = "\n".join(f"{msg.type}: {msg.content}" for msg in messages)
+    # Keep the most recent part if the backlog would overflow the model's context
+    transcript = transcript[-SUMMARY_MAX_INPUT_CHARS:]
+    prompt = "Summarize this conversation concisely, keeping facts and decisions."
+    if previous:
+        prompt = (
+            "Extend this summary of the earlier conversation with the messages "
+            f"below, keeping facts and decisions.\n\n{previous}"
+        )
+    response = summarizer.invoke([
+        SystemMessage(content=prompt),
+        HumanMessage(content=transcript),
+    ])
+    return response.content
 
 def chat_node(state: ChatState) -> dict:
     """Process chat messages using the language model.
     
+    Only the most recent CONTEXT_WINDOW to 2 * CONTEXT_WINDOW - 1 messages are
+    sent verbatim; anything older is represented by a summary kept in the
+    state, extended once every CONTEXT_WINDOW messages. If extending it
+    fails, the previous summary is used and the update is retried next turn.
+    
     Args:
-        state: Current chat state containing message history
+        state: Current chat state containing message history and summary
         
     Returns:
-        dict: Updated state with the model's response
+        dict: Updated state with the model's response and any new summary
     """
     messages = state['messages']
+    system = [msg for msg in messages[:1] if isinstance(msg, SystemMessage)]
+    history = messages[len(system):]
+    summary = state.get('summary', '')
+    summarized_upto = state.get('summarized_upto', 0)
+    update = {}
+    
+    cutoff = max(0, (len(history) - CONTEXT_WINDOW) // CONTEXT_WINDOW * CONTEXT_WINDOW)
+    if cutoff > summarized_upto:
+        try:
+            summary = extend_summary(summary, history[summarized_upto:cutoff])
+            update = {"summary": summary, "summarized_upto": cutoff}
+        except Exception:
+            log.exception("Error summarizing conversation")
+    
+    if cutoff:
+        prefix = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] if summary else []
+        messages = system + prefix + history[cutoff:]
+    
     response = llm.invoke(messages)
-    return {"messages": [response]}
+    return {"messages": [response], **update}
 
 # Initialize database connection and checkpointer
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'chatbot.db')
 db_conn = sqlite3.connect(database=DATABASE_PATH, check_same_thread=False)
+
+# Tune SQLite for frequent small checkpoint writes: WAL lets thread listing
+# read while a turn is being committed, and NORMAL sync avoids an fsync per commit.
+# SqliteSaver commits after every put, so the writes of a chat turn cannot be
+# grouped into one outer transaction; cheap WAL commits are the batching we get.
+db_conn.execute("PRAGMA journal_mode=WAL")
+db_conn.execute("PRAGMA synchronous=NORMAL")
+db_conn.execute("PRAGMA busy_timeout=5000")
+db_conn.execute("PRAGMA cache_size=-65536")  # 64 MB
+db_conn.execute("PRAGMA temp_store=MEMORY")
+db_conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+db_conn.execute("PRAGMA wal_autocheckpoint=1000")
+
 checkpointer = SqliteSaver(conn=db_conn)
 
+# Create the checkpoint tables up front so they can be queried directly
+checkpointer.setup()
+
+# Bounded pool of read-only checkpointers so thread listing and history loads
+# run in parallel under WAL instead of queueing behind the writer connection.
+# Streamlit runs each interaction on a fresh thread, so connections are checked
+# out per call rather than kept per thread.
+# At least one reader, otherwise every read would wait for a connection forever
+READ_POOL_SIZE = max(1, int(os.getenv('READ_POOL_SIZE', '4')))
+_read_pool: "queue.Queue[SqliteSaver]" = queue.Queue(maxsize=READ_POOL_SIZE)
+_read_pool_opened = 0
+_read_pool_lock = threading.Lock()
+
+def _open_read_checkpointer() -> SqliteSaver:
+    """Open a read-only connection and wrap it in a checkpointer."""
+    uri = f"{Path(DATABASE_PATH).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    saver = SqliteSaver(conn=conn)
+    # Tables were created by the writer above; setup would try to write
+    saver.is_setup = True
+    return saver
+
+@contextmanager
+def read_checkpointer() -> Iterator[SqliteSaver]:
+    """Check out a read-only checkpointer from the pool for one call.
+    
+    Opens a new connection while fewer than READ_POOL_SIZE exist, otherwise
+    waits for one to be returned. Use `.conn` for raw SQL queries.
+    """
+    global _read_pool_opened
+    try:
+        saver = _read_pool.get_nowait()
+    except queue.Empty:
+        with _read_pool_lock:
+            can_open = _read_pool_opened < READ_POOL_SIZE
+            if can_open:
+                _read_pool_opened += 1
+        if can_open:
+            try:
+                saver = _open_read_checkpointer()
+            except Exception:
+                with _read_pool_lock:
+                    _read_pool_opened -= 1
+                raise
+        else:
+            saver = _read_pool.get()
+    try:
+        yield saver
+    finally:
+        _read_pool.put(saver)
+
 # Build the conversation graph
 graph = StateGraph(ChatState)
 graph.add_node("chat_node", chat_node)
 graph.add_edge(START, "chat_node")
 graph.add_edge("chat_node", END)
 
-# Compile the graph with persistence
-chatbot = graph.compile(checkpointer=checkpointer)
+# Compile the graph with persistence; the run name is fixed, so it is bound
+# once here and only thread-specific settings are passed per turn
+chatbot = graph.compile(checkpointer=checkpointer).with_config(run_name="chat_turn")
 
-def retrieve_all_threads() -> List[str]:
-    """Retrieve all conversation thread IDs from the database.
+def retrieve_all_threads(limit: Optional[int] = 50) -> List[str]:
+    """Retrieve conversation thread IDs from the database, most recent first.
+    
+    Threads are ordered by their latest checkpoint ID, which LangGraph makes
+    time-ordered, so the order does not depend on the thread ID format.
+    
+    Args:
+        limit: Maximum number of thread IDs to return, or None for all
     
     Returns:
         List[str]: List of thread IDs
     """
-    all_threads = set()
+    try:
+        # Grouping walks the checkpoints primary key (thread_id, checkpoint_ns,
+        # checkpoint_id) with no checkpoint deserialization
+        with read_checkpointer() as reader:
+            cur = reader.conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id "
+                "ORDER BY MAX(checkpoint_id) DESC LIMIT ?",
+                (-1 if limit is None else limit,)
+            )
+            return [row[0] for row in cur.fetchall()]
+    except sqlite3.OperationalError:
+        log.warning(
+            "Direct thread query failed; falling back to a full checkpoint scan",
+            exc_info=True
+        )
+
+    # Fall back to the checkpointer API if the table layout has changed
+    latest_checkpoints = {}
     try:
         for checkpoint in checkpointer.list(None):
-            all_threads.add(checkpoint.config['configurable']['thread_id'])
-    except Exception as e:
-        print(f"Error retrieving threads: {e}")
-    return list(all_threads)
+            configurable = checkpoint.config['configurable']
+            thread_id = configurable['thread_id']
+            checkpoint_id = configurable.get('checkpoint_id', '')
+            if checkpoint_id >= latest_checkpoints.get(thread_id, ''):
+                latest_checkpoints[thread_id] = checkpoint_id
+    except Exception:
+        log.exception("Error retrieving threads")
+    return sorted(latest_checkpoints, key=latest_checkpoints.get, reverse=True)[:limit]
 
-def get_conversation_history(thread_id: str) -> List[BaseMessage]:
-    """Retrieve conversation history for a specific thread.
+def get_conversation_history(
+    thread_id: str,
+    limit: Optional[int] = 50,
+    before: int = 0
+) -> List[BaseMessage]:
+    """Retrieve a page of conversation history for a specific thread.
     
     Args:
         thread_id: ID of the conversation thread
+        limit: Maximum number of messages to return, or None for all
+        before: Number of most recent messages to skip, used to page backwards
         
     Returns:
-        List[BaseMessage]: List of messages in the conversation
+        List[BaseMessage]: Messages in the page, oldest first
     """
     try:
-        state = chatbot.get_state(config={'configurable': {'thread_id': thread_id}})
-        return state.values.get('messages', [])
-    except Exception as e:
-        print(f"Error loading conversation: {e}")
+        with read_checkpointer() as reader:
+            checkpoint_tuple = reader.get_tuple(
+                {'configurable': {'thread_id': thread_id}}
+            )
+        if checkpoint_tuple is None:
+            return []
+        messages = checkpoint_tuple.checkpoint['channel_values'].get('messages', [])
+    except Exception:
+        log.exception("Error loading conversation %s", thread_id)
         return []
+    end = len(messages) - before
+    start = 0 if limit is None else max(0, end - limit)
+    return messages[start:max(0, end)]
 
 # Add proper cleanup on application exit
 import atexit
 
 def cleanup():
-    """Clean up database connections on application exit."""
+    """Clean up database and HTTP connections on application exit."""
+    while True:
+        try:
+            _read_pool.get_nowait().conn.close()
+        except queue.Empty:
+            break
     if 'db_conn' in globals():
+        try:
+            db_conn.execute("PRAGMA optimize")
+            db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
         db_conn.close()
+    if 'http_client' in globals():
+        http_client.close()
 
 atexit.register(cleanup)